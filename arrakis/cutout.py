@@ -501,7 +501,11 @@ def cutout_islands(
     )
 
     beams_col, island_col, comp_col = get_db(
-        host=host, epoch=epoch, username=username, password=password
+        host=host,
+        epoch=epoch,
+        username=username,
+        password=password,
+        ensure_indexes=True,
     )
 
     # Check for SBID match
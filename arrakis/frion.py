@@ -4,23 +4,28 @@
 import argparse
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, wraps
 from pathlib import Path
 from pprint import pformat
 from typing import Callable, Dict, List
 from typing import NamedTuple as Struct
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
 from urllib.error import URLError
 
 import astropy.units as u
 import numpy as np
 import pymongo
 from astropy.time import Time, TimeDelta
+from bson.binary import Binary
 from FRion import correct, predict
 from prefect import flow, task
 from tqdm.auto import tqdm
 
 from arrakis.logger import TqdmToLogger, UltimateHelpFormatter, logger
 from arrakis.utils.database import (
+    chunked_bulk_write,
+    combine_bulk_results,
     get_db,
     get_field_db,
     test_db,
@@ -32,6 +37,51 @@ from arrakis.utils.pipeline import generic_parser, logo_str, workdir_arg_parser
 logger.setLevel(logging.INFO)
 TQDM_OUT = TqdmToLogger(logger, level=logging.INFO)
 
+# Corrections applied at once by each FRion loop task
+CORRECTION_THREADS = 4
+
+
+def cache_ionex_reader(maxsize: int = 8) -> None:
+    """Cache RMextract's IONEX parser for the lifetime of this process
+
+    Every FRion prediction for an observation reads the same few IONEX
+    files, so only the first call in each worker process needs to parse them.
+    This patches RMextract, so it is only done by the FRion tasks, not on
+    import. Calling it again is a no-op.
+
+    Args:
+        maxsize (int, optional): Number of parsed IONEX files to keep. Defaults to 8.
+    """
+    try:
+        from RMextract import getIONEX
+    except ImportError:
+        logger.warning("Could not import RMextract - IONEX files will not be cached")
+        return
+
+    reader = getattr(getIONEX, "read_tec", None)
+    if reader is None:
+        logger.warning(
+            "RMextract.getIONEX.read_tec not found - IONEX files will not be cached"
+        )
+        return
+    if hasattr(reader, "cache_info"):
+        return
+
+    cached_reader = lru_cache(maxsize=maxsize)(reader)
+
+    @wraps(reader)
+    def read_tec(*args, **kwargs):
+        # Hand out copies, so nothing downstream can modify the cached arrays
+        result = cached_reader(*args, **kwargs)
+        if isinstance(result, (tuple, list)):
+            return type(result)(
+                np.copy(val) if isinstance(val, np.ndarray) else val for val in result
+            )
+        return np.copy(result) if isinstance(result, np.ndarray) else result
+
+    read_tec.cache_info = cached_reader.cache_info
+    getIONEX.read_tec = read_tec
+
 
 class Prediction(Struct):
     """FRion prediction"""
@@ -45,9 +95,50 @@ class FrionResults(Struct):
     correction: pymongo.UpdateOne
 
 
+class PredictConfig(Struct):
+    """Inputs shared by every FRion prediction in a flow"""
+
+    field: str
+    """RACS field name"""
+    start_time: Time
+    """Start time of the observation"""
+    end_time: Time
+    """End time of the observation"""
+    freq: np.ndarray
+    """Array of frequencies in Hz"""
+    cutdir: Path
+    """Cutout directory"""
+    plotdir: Path
+    """Plot directory"""
+    server: str
+    """IONEX server"""
+    prefix: str
+    """IONEX prefix"""
+    formatter: Optional[Union[str, Callable]]
+    """IONEX formatter"""
+    proxy_server: Optional[str]
+    """Proxy server"""
+    pre_download: bool
+    """Pre-download IONEX files"""
+
+
+class IonKeys(Struct):
+    """Database keys for the corrected files"""
+
+    q_file_ion: str
+    """Key for the corrected Stokes Q file"""
+    u_file_ion: str
+    """Key for the corrected Stokes U file"""
+
+
 @task(name="FRion correction")
 def correct_worker(
-    beam: Dict, outdir: str, field: str, prediction: Prediction, island: dict
+    beam: Dict,
+    outdir: str,
+    field: str,
+    prediction: Prediction,
+    island: dict,
+    ion_keys: IonKeys,
 ) -> pymongo.UpdateOne:
     """Apply FRion corrections to a single island
 
@@ -57,6 +148,7 @@ def correct_worker(
         field (str): RACS field name
         predict_file (str): FRion prediction file
         island_id (str): RACS island ID
+        ion_keys (IonKeys): Database keys for the corrected files
 
     Returns:
         pymongo.UpdateOne: Pymongo update query
@@ -78,54 +170,36 @@ def correct_worker(
 
     myquery = {"Source_ID": island_id}
 
-    newvalues = {
-        "$set": {
-            f"beams.{field}.q_file_ion": qout,
-            f"beams.{field}.u_file_ion": uout,
-        }
-    }
+    newvalues = {"$set": {ion_keys.q_file_ion: qout, ion_keys.u_file_ion: uout}}
     return pymongo.UpdateOne(myquery, newvalues)
 
 
-@task(name="FRion predction")
-def predict_worker(
-    island: Dict,
-    field: str,
-    beam: Dict,
+def calculate_modulation(
+    ra: float,
+    dec: float,
     start_time: Time,
     end_time: Time,
     freq: np.ndarray,
-    cutdir: Path,
-    plotdir: Path,
+    ionex_path: Path,
     server: str = "ftp://ftp.aiub.unibe.ch/CODE/",
     prefix: str = "",
     formatter: Optional[Union[str, Callable]] = None,
     proxy_server: Optional[str] = None,
     pre_download: bool = False,
-) -> Prediction:
-    """Make FRion prediction for a single island
+) -> Tuple[Time, np.ndarray, np.ndarray, str]:
+    """Run the FRion modulation prediction, trying IONEX prefixes in turn
 
     Args:
-        island (Dict): Pymongo island document
-        field (str): RACS field name
-        beam (Dict): Pymongo beam document
+        ra (float): Right ascension of the source
+        dec (float): Declination of the source
         start_time (Time): Start time of the observation
         end_time (Time): End time of the observation
-        freq (np.ndarray): Array of frequencies with units
-        cutdir (str): Cutout directory
-        plotdir (str): Plot directory
+        freq (np.ndarray): Array of frequencies in Hz
+        ionex_path (Path): Directory to store IONEX files
 
     Returns:
-        Tuple[str, pymongo.UpdateOne]: FRion prediction file and pymongo update query
+        Tuple[Time, np.ndarray, np.ndarray, str]: Times, RMs, theta and the IONEX prefix used
     """
-    logger.setLevel(logging.INFO)
-
-    ifile: Path = cutdir / beam["beams"][field]["i_file"]
-    i_dir = ifile.parent
-    iname = island["Source_ID"]
-    ra = island["RA"]
-    dec = island["Dec"]
-
     # Tricking the ionex lookup to use the a custom server
     proxy_args = {
         "proxy_type": None,
@@ -155,7 +229,7 @@ def predict_worker(
                 ra=ra,
                 dec=dec,
                 timestep=300.0,
-                ionexPath=cutdir.parent / "IONEXdata",
+                ionexPath=ionex_path,
                 server=server,
                 proxy_server=proxy_server,
                 use_proxy=True,  # Always use proxy - forces urllib
@@ -164,15 +238,95 @@ def predict_worker(
                 pre_download=pre_download,
                 **proxy_args,
             )
-            break
+            return times, RMs, theta, _prefix
         except URLError:
             logger.error(f"Could not find IONEX file with prefix '{_prefix}'")
             logger.warning("Trying next prefix.")
             continue
-    else:
-        raise FileNotFoundError(
-            f"Could not find IONEX file with prefixes {_prefixes_to_try}"
-        )
+
+    raise FileNotFoundError(
+        f"Could not find IONEX file with prefixes {_prefixes_to_try}"
+    )
+
+
+@task(name="Download IONEX")
+def download_ionex(
+    island: Dict,
+    start_time: Time,
+    end_time: Time,
+    freq: np.ndarray,
+    cutdir: Path,
+    server: str = "ftp://ftp.aiub.unibe.ch/CODE/",
+    prefix: str = "",
+    formatter: Optional[Union[str, Callable]] = None,
+    proxy_server: Optional[str] = None,
+    pre_download: bool = False,
+) -> str:
+    """Fetch the IONEX files for the observation once, ahead of the predictions
+
+    Args:
+        island (Dict): Pymongo island document used for the test prediction
+        start_time (Time): Start time of the observation
+        end_time (Time): End time of the observation
+        freq (np.ndarray): Array of frequencies in Hz
+        cutdir (Path): Cutout directory
+
+    Returns:
+        str: IONEX prefix that was found on the server
+    """
+    *_, found_prefix = calculate_modulation(
+        ra=island["RA"],
+        dec=island["Dec"],
+        start_time=start_time,
+        end_time=end_time,
+        freq=freq,
+        ionex_path=cutdir.parent / "IONEXdata",
+        server=server,
+        prefix=prefix,
+        formatter=formatter,
+        proxy_server=proxy_server,
+        pre_download=pre_download,
+    )
+    logger.info(f"Using IONEX prefix '{found_prefix}'")
+    return found_prefix
+
+
+@task(name="FRion predction")
+def predict_worker(
+    island: Dict,
+    beam: Dict,
+    config: PredictConfig,
+) -> Prediction:
+    """Make FRion prediction for a single island
+
+    Args:
+        island (Dict): Pymongo island document
+        beam (Dict): Pymongo beam document
+        config (PredictConfig): Inputs shared by all predictions
+
+    Returns:
+        Tuple[str, pymongo.UpdateOne]: FRion prediction file and pymongo update query
+    """
+    logger.setLevel(logging.INFO)
+
+    ifile: Path = config.cutdir / beam["beams"][config.field]["i_file"]
+    i_dir = ifile.parent
+    iname = island["Source_ID"]
+    freq = config.freq
+
+    times, RMs, theta, _ = calculate_modulation(
+        ra=island["RA"],
+        dec=island["Dec"],
+        start_time=config.start_time,
+        end_time=config.end_time,
+        freq=freq,
+        ionex_path=config.cutdir.parent / "IONEXdata",
+        server=config.server,
+        prefix=config.prefix,
+        formatter=config.formatter,
+        proxy_server=config.proxy_server,
+        pre_download=config.pre_download,
+    )
 
     predict_file = os.path.join(i_dir, f"{iname}_ion.txt")
     predict.write_modulation(freq_array=freq, theta=theta, filename=predict_file)
@@ -180,15 +334,22 @@ def predict_worker(
 
     myquery = {"Source_ID": iname}
 
+    # Turn back into MJD seconds for backwards compatibility
+    # MJD seconds need double precision to resolve the timestep
+    # Don't scale in place - astropy caches the array returned by Time.mjd
+    mjd_seconds = times.mjd * 86400.0
+    frion_arrays = {
+        "times": mjd_seconds.astype(np.float64, copy=False),
+        "RMs": np.asarray(RMs, dtype=np.float32),
+        "theta": theta.astype(np.complex64),
+    }
+    # Read back with np.frombuffer(blob, dtype=dtypes[key]).reshape(shapes[key])
     newvalues = {
         "$set": {
             "frion": {
-                "times": (
-                    times.mjd * 86400.0
-                ).tolist(),  # Turn back into MJD seconds for backwards compatibility
-                "RMs": RMs.tolist(),
-                "theta_real": theta.real.tolist(),
-                "theta_imag": theta.imag.tolist(),
+                **{key: Binary(arr.tobytes()) for key, arr in frion_arrays.items()},
+                "dtypes": {key: arr.dtype.str for key, arr in frion_arrays.items()},
+                "shapes": {key: list(arr.shape) for key, arr in frion_arrays.items()},
             }
         }
     }
@@ -198,56 +359,41 @@ def predict_worker(
     return Prediction(predict_file, update)
 
 
-@task(name="Index beams")
-def index_beams(island: dict, beams: List[dict]) -> dict:
-    island_id = island["Source_ID"]
-    beam_idx = [i for i, b in enumerate(beams) if b["Source_ID"] == island_id][0]
-    beam = beams[beam_idx]
-    return beam
-
-
-# We reduce the inner loop to a serial call
+# We reduce the inner loop to a serial call over a batch of islands
 # This is to avoid overwhelming the Prefect server
 @task(name="FRion loop")
 def serial_loop(
-    island: dict,
-    field: str,
-    beam: dict,
-    start_time: Time,
-    end_time: Time,
-    freq_hz_array: np.ndarray,
-    cutdir: Path,
-    plotdir: Path,
-    ionex_server: str,
-    ionex_prefix: str,
-    ionex_proxy_server: Optional[str],
-    ionex_formatter: Optional[Union[str, Callable]],
-    ionex_predownload: bool,
-) -> FrionResults:
-    prediction = predict_worker.fn(
-        island=island,
-        field=field,
-        beam=beam,
-        start_time=start_time,
-        end_time=end_time,
-        freq=freq_hz_array,
-        cutdir=cutdir,
-        plotdir=plotdir,
-        server=ionex_server,
-        prefix=ionex_prefix,
-        proxy_server=ionex_proxy_server,
-        formatter=ionex_formatter,
-        pre_download=ionex_predownload,
-    )
-    correction = correct_worker.fn(
-        beam=beam,
-        outdir=cutdir,
-        field=field,
-        prediction=prediction,
-        island=island,
-    )
+    islands: List[dict],
+    beams: List[dict],
+    config: PredictConfig,
+    ion_keys: IonKeys,
+) -> List[FrionResults]:
+    cache_ionex_reader()
+    # Apply the corrections on a few threads, so their FITS I/O overlaps with
+    # the next island's prediction. Threads (not processes) are safe inside
+    # a Dask worker, and the pool is bounded to limit open files and memory.
+    predictions = []
+    corrections = []
+    with ThreadPoolExecutor(max_workers=CORRECTION_THREADS) as executor:
+        for island, beam in zip(islands, beams):
+            prediction = predict_worker.fn(island=island, beam=beam, config=config)
+            predictions.append(prediction)
+            corrections.append(
+                executor.submit(
+                    correct_worker.fn,
+                    beam=beam,
+                    outdir=config.cutdir,
+                    field=config.field,
+                    prediction=prediction,
+                    island=island,
+                    ion_keys=ion_keys,
+                )
+            )
 
-    return FrionResults(prediction=prediction, correction=correction)
+    return [
+        FrionResults(prediction=prediction, correction=correction.result())
+        for prediction, correction in zip(predictions, corrections)
+    ]
 
 
 @flow(name="FRion")
@@ -266,6 +412,9 @@ def main(
     ionex_formatter: Optional[Union[str, Callable]] = "ftp.aiub.unibe.ch",
     ionex_predownload: bool = False,
     limit: Optional[int] = None,
+    batch_size: int = 50,
+    write_size: int = 1_000,
+    force: bool = False,
 ):
     """FRion flow
 
@@ -283,6 +432,9 @@ def main(
         ionex_formatter (Union[str, Callable], optional): IONEX formatter. Defaults to "ftp.aiub.unibe.ch".
         ionex_predownload (bool, optional): Pre-download IONEX files. Defaults to False.
         limit (int, optional): Limit to number of islands. Defaults to None.
+        batch_size (int, optional): Number of islands per FRion task. Defaults to 50.
+        write_size (int, optional): Number of updates per database write. Defaults to 1_000.
+        force (bool, optional): Redo islands that have already been corrected. Defaults to False.
     """
     # Query database for data
     outdir = outdir.absolute()
@@ -294,14 +446,11 @@ def main(
     beams_col, island_col, comp_col = get_db(
         host=host, epoch=epoch, username=username, password=password
     )
+    field_col = get_field_db(
+        host=host, epoch=epoch, username=username, password=password
+    )
     # Check for SBID match
     if sbid is not None:
-        field_col = get_field_db(
-            host=host,
-            epoch=epoch,
-            username=username,
-            password=password,
-        )
         sbid_check = validate_sbid_field_pair(
             field_name=field,
             sbid=sbid,
@@ -315,16 +464,53 @@ def main(
     if sbid is not None:
         query_1["$and"].append({f"beams.{field}.SBIDs": sbid})
 
-    beams = list(beams_col.find(query_1).sort("Source_ID"))
-    island_ids = sorted(beams_col.distinct("Source_ID", query_1))
+    # Skip islands that have already been corrected. LINMOS clears the
+    # corrected files whenever it makes new Q/U mosaics.
+    if not force:
+        query_done = {
+            "$and": query_1["$and"]
+            + [{f"beams.{field}.q_file_ion": {"$exists": True}}]
+        }
+        n_skipped = beams_col.count_documents(query_done)
+        if n_skipped > 0:
+            logger.info(
+                f"Skipping {n_skipped} islands in {field} that are already corrected - use force to redo"
+            )
+        query_1["$and"].append({f"beams.{field}.q_file_ion": {"$exists": False}})
+
+    # Only pull the fields we use - the beam documents can be large
+    beams_projection = {
+        "Source_ID": 1,
+        f"beams.{field}.i_file": 1,
+        f"beams.{field}.q_file": 1,
+        f"beams.{field}.u_file": 1,
+    }
+    # Stream the cursor straight into the lookup table
+    beam_by_id = {
+        b["Source_ID"]: b
+        for b in beams_col.find(query_1, beams_projection)
+        .sort("Source_ID")
+        .batch_size(1_000)
+    }
+    island_ids = sorted(beam_by_id)
+    if len(island_ids) == 0:
+        logger.warning(f"No islands left to correct in {field} - use force to redo")
+        return
+    if limit is not None:
+        logger.info(f"Limiting to {limit} islands")
+        island_ids = island_ids[:limit]
 
     # Get FRion arguments
-    query_2 = {"Source_ID": {"$in": island_ids}}
-    islands = list(island_col.find(query_2).sort("Source_ID"))
+    # Query in sorted batches to keep the $in lists small
+    islands = []
+    for i in range(0, len(island_ids), 1_000):
+        query_2 = {"Source_ID": {"$in": island_ids[i : i + 1_000]}}
+        islands.extend(
+            island_col.find(query_2, {"Source_ID": 1, "RA": 1, "Dec": 1})
+            .sort("Source_ID")
+            .batch_size(1_000)
+        )
 
-    field_col = get_field_db(
-        host=host, epoch=epoch, username=username, password=password
-    )
     # SELECT '1' is best field according to the database
     query_3 = {"$and": [{"FIELD_NAME": f"{field}"}, {"SELECT": 1}]}
     if sbid is not None:
@@ -332,50 +518,42 @@ def main(
     logger.info(f"{query_3}")
 
     # Raise error if too much or too little data
-    if field_col.count_documents(query_3) > 1:
+    # Two documents are enough to tell the cases apart
+    field_docs = list(field_col.find(query_3).limit(2))
+    if len(field_docs) > 1:
         logger.error(f"More than one SELECT=1 for {field} - try supplying SBID.")
         raise ValueError(f"More than one SELECT=1 for {field} - try supplying SBID.")
 
-    elif field_col.count_documents(query_3) == 0:
+    elif len(field_docs) == 0:
         logger.error(f"No data for {field} with {query_3}, trying without SELECT=1.")
-        query_3 = query_3 = {"$and": [{"FIELD_NAME": f"{field}"}]}
+        query_3 = {"$and": [{"FIELD_NAME": f"{field}"}]}
         if sbid is not None:
             query_3["$and"].append({"SBID": sbid})
-        field_data = field_col.find_one({"FIELD_NAME": f"{field}"})
+        field_data = field_col.find_one(query_3)
     else:
         logger.info(f"Using {query_3}")
-        field_data = field_col.find_one({"FIELD_NAME": f"{field}"})
+        field_data = field_docs[0]
 
     logger.info(f"{field_data=}")
 
     start_time = Time(field_data["SCAN_START"] * u.second, format="mjd")
     end_time = start_time + TimeDelta(field_data["SCAN_TINT"] * u.second)
 
+    first_beam = beam_by_id[island_ids[0]]
     freq = getfreq(
-        os.path.join(cutdir, f"{beams[0]['beams'][f'{field}']['q_file']}"),
+        os.path.join(cutdir, f"{first_beam['beams'][f'{field}']['q_file']}"),
     )
 
-    if limit is not None:
-        logger.info(f"Limiting to {limit} islands")
-        islands = islands[:limit]
-
-    beams_cor = []
-    for island in islands:
-        island_id = island["Source_ID"]
-        beam_idx = [i for i, b in enumerate(beams) if b["Source_ID"] == island_id][0]
-        beam = beams[beam_idx]
-        beams_cor.append(beam)
+    beams_cor = [beam_by_id[island["Source_ID"]] for island in islands]
 
-    # do one prediction to get the IONEX files
-    _ = predict_worker(
+    # Fetch the IONEX files once - every prediction then reads them from disk
+    # using the prefix that was actually found on the server
+    ionex_prefix = download_ionex(
         island=islands[0],
-        field=field,
-        beam=beams_cor[0],
         start_time=start_time,
         end_time=end_time,
         freq=freq.to(u.Hz).value,
         cutdir=cutdir,
-        plotdir=plotdir,
         server=ionex_server,
         prefix=ionex_prefix,
         proxy_server=ionex_proxy_server,
@@ -383,47 +561,77 @@ def main(
         pre_download=ionex_predownload,
     )
 
-    frion_results = []
     assert len(islands) == len(beams_cor), "Islands and beams must be the same length"
-    for island, beam in tqdm(
-        zip(islands, beams_cor),
+    predict_config = PredictConfig(
+        field=field,
+        start_time=start_time,
+        end_time=end_time,
+        freq=freq.to(u.Hz).value,
+        cutdir=cutdir,
+        plotdir=plotdir,
+        server=ionex_server,
+        prefix=ionex_prefix,
+        formatter=ionex_formatter,
+        proxy_server=ionex_proxy_server,
+        pre_download=ionex_predownload,
+    )
+    ion_keys = IonKeys(
+        q_file_ion=f"beams.{field}.q_file_ion",
+        u_file_ion=f"beams.{field}.u_file_ion",
+    )
+    # Submit islands in batches to cut down on per-task overhead
+    n_batches = max(1, len(islands) // batch_size)
+    batch_bounds = np.linspace(0, len(islands), n_batches + 1).astype(int)
+    frion_results = []
+    for start, stop in tqdm(
+        zip(batch_bounds[:-1], batch_bounds[1:]),
         desc="Submitting tasks",
         file=TQDM_OUT,
-        total=len(islands),
+        total=n_batches,
     ):
         frion_result = serial_loop.submit(
-            island=island,
-            field=field,
-            beam=beam,
-            start_time=start_time,
-            end_time=end_time,
-            freq_hz_array=freq.to(u.Hz).value,
-            cutdir=cutdir,
-            plotdir=plotdir,
-            ionex_server=ionex_server,
-            ionex_prefix=ionex_prefix,
-            ionex_proxy_server=ionex_proxy_server,
-            ionex_formatter=ionex_formatter,
-            ionex_predownload=ionex_predownload,
+            islands=islands[start:stop],
+            beams=beams_cor[start:stop],
+            config=predict_config,
+            ion_keys=ion_keys,
         )
         frion_results.append(frion_result)
 
-    predictions = []
-    corrections = []
-    for result in frion_results:
-        predictions.append(result.result().prediction)
-        corrections.append(result.result().correction)
+    # Write to the database in the background as batches finish, so the
+    # writes overlap with the islands that are still being processed
+    updates: List[pymongo.UpdateOne] = []
+    updates_arrays: List[pymongo.UpdateOne] = []
+    beams_writes = []
+    island_writes = []
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for batch in frion_results:
+            for result in batch.result():
+                updates_arrays.append(result.prediction.update)
+                updates.append(result.correction)
+
+            if database and len(updates) >= write_size:
+                beams_writes.append(
+                    executor.submit(chunked_bulk_write, beams_col, updates)
+                )
+                island_writes.append(
+                    executor.submit(chunked_bulk_write, island_col, updates_arrays)
+                )
+                updates, updates_arrays = [], []
+
+        if database and len(updates) > 0:
+            beams_writes.append(executor.submit(chunked_bulk_write, beams_col, updates))
+            island_writes.append(
+                executor.submit(chunked_bulk_write, island_col, updates_arrays)
+            )
 
-    updates_arrays = [p.update for p in predictions]
-    updates = corrections
-    if database:
-        logger.info("Updating beams database...")
-        db_res = beams_col.bulk_write(updates, ordered=False)
-        logger.info(pformat(db_res.bulk_api_result))
+        if database:
+            logger.info("Updating beams database...")
+            db_res = combine_bulk_results([f.result() for f in beams_writes])
+            logger.info(pformat(db_res))
 
-        logger.info("Updating island database...")
-        db_res = island_col.bulk_write(updates_arrays, ordered=False)
-        logger.info(pformat(db_res.bulk_api_result))
+            logger.info("Updating island database...")
+            db_res = combine_bulk_results([f.result() for f in island_writes])
+            logger.info(pformat(db_res))
 
 
 def frion_parser(parent_parser: bool = False) -> argparse.ArgumentParser:
@@ -476,6 +684,12 @@ def frion_parser(parent_parser: bool = False) -> argparse.ArgumentParser:
         help="Pre-download IONEX files.",
     )
 
+    parser.add_argument(
+        "--frion_force",
+        action="store_true",
+        help="Redo the correction for islands that already have corrected files.",
+    )
+
     return frion_parser
 
 
@@ -523,6 +737,7 @@ def cli():
         ionex_formatter=args.ionex_formatter,
         ionex_prefix=args.ionex_prefix,
         ionex_predownload=args.ionex_predownload,
+        force=args.frion_force,
     )
 
 
@@ -7,8 +7,9 @@ import hashlib
 import logging
 import os
 import pickle
+import re
 import shutil
-from glob import glob
+from collections import defaultdict
 from pathlib import Path
 from subprocess import CalledProcessError
 from typing import Any, Dict, List
@@ -32,6 +33,7 @@ import matplotlib.pyplot as plt
 import matplotlib
 from prefect import flow, get_run_logger, task
 from racs_tools import beamcon_2D
+from radio_beam import Beam
 from spython.main import Client as sclient
 from skimage.transform import resize
 from tqdm.auto import tqdm
@@ -40,7 +42,7 @@ from arrakis.logger import TqdmToLogger, UltimateHelpFormatter, logger
 from arrakis.utils.io import parse_env_path
 from arrakis.utils.msutils import (
     beam_from_ms,
-    field_idx_from_ms,
+    field_info_from_ms,
     field_name_from_ms,
     get_pol_axis,
     wsclean,
@@ -230,26 +232,34 @@ def cleanup_imageset(purge: bool, image_set: ImageSet) -> None:
         logger.info("Not purging intermediate files")
         return
 
-    for pol, image_list in image_set.image_lists.items():
-        logger.critical(f"Removing {pol=} images for {image_set.ms}")
-        for image in image_list:
-            logger.critical(f"Removing {image}")
-            try:
-                os.remove(image)
-            except FileNotFoundError:
-                logger.critical(f"{image} not available for deletion. ")
+    to_remove: List[str] = []
+    for image_list in image_set.image_lists.values():
+        to_remove.extend(image_list)
 
     # The aux images are the same between the native images and the smoothed images,
     # they were just copied across directly without modification
     if image_set.aux_lists:
-        logger.critical("Removing auxillary images. ")
-        for (pol, aux), aux_list in image_set.aux_lists.items():
-            for aux_image in aux_list:
-                try:
-                    logger.critical(f"Removing {aux_image}")
-                    os.remove(aux_image)
-                except FileNotFoundError:
-                    logger.critical(f"{aux_image} not available for deletion. ")
+        for aux_list in image_set.aux_lists.values():
+            to_remove.extend(aux_list)
+    # Shared files (e.g. the psf) can be listed under several pols
+    to_remove = list(dict.fromkeys(to_remove))
+
+    def _remove(image: str) -> bool:
+        logger.debug(f"Removing {image}")
+        try:
+            os.remove(image)
+        except FileNotFoundError:
+            logger.debug(f"{image} not available for deletion. ")
+            return False
+        return True
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        removed = sum(executor.map(_remove, to_remove))
+
+    logger.critical(
+        f"Removed {removed} of {len(to_remove)} files for {image_set.ms} "
+        f"({len(to_remove) - removed} not available for deletion)"
+    )
 
     return
 
@@ -257,22 +267,58 @@ def cleanup_imageset(purge: bool, image_set: ImageSet) -> None:
 def get_prefix(
     ms: Path,
     out_dir: Path,
+    field: Optional[str] = None,
 ) -> Path:
     """Derive a consistent prefix style from a input MS name.
 
     Args:
         ms (Path): Path to a Measurement Set that a prefix will be derived from
         out_dir (Path): The final location that wsclean output data will be written to
+        field (Optional[str], optional): Field name, if already known. Read from the MS if not set. Defaults to None.
 
     Returns:
         Path: The prefix, including the output directory name.
     """
-    field = field_name_from_ms(ms.resolve(strict=True).as_posix())
-    beam = beam_from_ms(ms.resolve(strict=True).as_posix())
+    ms_posix = ms.resolve(strict=True).as_posix()
+    if field is None:
+        field = field_name_from_ms(ms_posix)
+    beam = beam_from_ms(ms_posix)
     prefix = f"image.{field}.contcube.beam{beam:02}"
     return out_dir / prefix
 
 
+def scan_wsclean_outputs(
+    directory: Path, prefix_name: str, suffixes: List[str]
+) -> Dict[Tuple[Optional[str], str, bool], List[Path]]:
+    """Classify the wsclean FITS outputs for a prefix with a single directory scan.
+
+    Args:
+        directory (Path): Directory containing the wsclean outputs
+        prefix_name (str): File name of the wsclean prefix
+        suffixes (List[str]): Image types to collect (e.g. "image", "psf")
+
+    Returns:
+        Dict[Tuple[Optional[str], str, bool], List[Path]]: Sorted lists of files. The keys are
+        the polarisation (None if not in the file name), the image type, and whether the
+        file is the MFS image.
+    """
+    pattern = re.compile(
+        rf"^{re.escape(prefix_name)}-(?:(MFS)|.*[0-9])(?:-([IQUV]))?-({'|'.join(suffixes)})\.fits$"
+    )
+    buckets: Dict[Tuple[Optional[str], str, bool], List[Path]] = defaultdict(list)
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            match = pattern.match(entry.name)
+            if match is None:
+                continue
+            mfs, pol, suffix = match.groups()
+            buckets[(pol, suffix, mfs is not None)].append(directory / entry.name)
+
+    for files in buckets.values():
+        files.sort()
+    return buckets
+
+
 def run_wsclean_singuarlity(
     command: str,
     simage: Path,
@@ -281,22 +327,28 @@ def run_wsclean_singuarlity(
 ) -> None:
     logger = get_run_logger()
     logger.info(f"Running wsclean with command: {command}")
+    root_dir_posix = root_dir.resolve(strict=True).as_posix()
+    # Log the output in blocks rather than line by line
+    buffer: List[str] = []
     try:
         output = sclient.execute(
             image=simage.resolve(strict=True).as_posix(),
             command=command.split(),
-            bind=f"{out_dir}:{out_dir}, {root_dir.resolve(strict=True).as_posix()}:{root_dir.resolve(strict=True).as_posix()}",
+            bind=f"{out_dir}:{out_dir}, {root_dir_posix}:{root_dir_posix}",
             return_result=True,
             quiet=False,
             stream=True,
         )
         for line in output:
-            logger.info(line.rstrip())
+            buffer.append(line.rstrip())
             # Catch divergence - look for the string 'KJy' in the output
             if "KJy" in line:
                 raise DivergenceError(
                     f"Detected divergence in wsclean output: {line.rstrip()}"
                 )
+            if len(buffer) >= 64:
+                logger.info("\n".join(buffer))
+                buffer.clear()
 
     except CalledProcessError as e:
         logger.error(f"Failed to run wsclean with command: {command}")
@@ -305,8 +357,13 @@ def run_wsclean_singuarlity(
         logger.error(f"{e=}")
         raise e
 
+    finally:
+        # Always log the tail of the output - on failure it holds the error
+        if buffer:
+            logger.info("\n".join(buffer))
 
-@task(name="Image Beam", persist_result=True)
+
+@task(name="Image Beam", persist_result=True, tags=["wsclean"])
 def image_beam(
     ms: Path,
     field_idx: int,
@@ -484,29 +541,23 @@ def image_beam(
         # For multiple pols files are
         # {prefix}-{chan:02d}-{pol}-{suffix}.fits
 
+        temp_outputs = scan_wsclean_outputs(
+            directory=temp_dir_images, prefix_name=prefix.name, suffixes=suffixes
+        )
         all_fits_files = []
         for pol in pols:
+            file_pol = None if len(pols) == 1 else pol
             for suffix in suffixes:
                 # Get channel images
-                globstr = (
-                    f"{prefix.name}-*[0-9]-{suffix}.fits"
-                    if len(pols) == 1
-                    else f"{prefix.name}-*[0-9]-{pol}-{suffix}.fits"
-                )
-                sub_fits_files = list(temp_dir_images.glob(globstr))
-                all_fits_files.extend(sub_fits_files)
-
+                all_fits_files.extend(temp_outputs.get((file_pol, suffix, False), []))
                 # Get the MFS image
-                mfs_globstr = (
-                    f"{prefix.name}-MFS-{pol}-{suffix}.fits"
-                    if len(pols) > 1
-                    else f"{prefix.name}-MFS-{suffix}.fits"
-                )
-                mfs_files = list(temp_dir_images.glob(mfs_globstr))
-                all_fits_files.extend(mfs_files)
+                all_fits_files.extend(temp_outputs.get((file_pol, suffix, True), []))
 
-        for fits_file in tqdm(all_fits_files, desc="Copying images", file=TQDM_OUT):
-            logger.info(f"Copying {fits_file} to {out_dir}")
+        # No progress bar here - this runs on a worker. Log one summary
+        # line, with the individual files at debug level
+        logger.info(f"Copying {len(all_fits_files)} images to {out_dir}")
+        for fits_file in all_fits_files:
+            logger.debug(f"Copying {fits_file} to {out_dir}")
             shutil.copy(fits_file, out_dir)
             # Purge the temp directory
             fits_file.unlink()
@@ -534,26 +585,29 @@ def image_beam(
             )
 
     # Get images
+    outputs = scan_wsclean_outputs(
+        directory=Path(prefix_str).parent,
+        prefix_name=Path(prefix_str).name,
+        suffixes=suffixes,
+    )
     image_lists = {}
     aux_lists = {}
     aux_suffixes = suffixes[1:]
     for pol in pols:
-        imglob = (
-            f"{prefix_str}-*[0-9]-image.fits"
-            if len(pols) == 1
-            else f"{prefix_str}-*[0-9]-{pol}-image.fits"
-        )
-        image_list = sorted(glob(imglob))
+        file_pol = None if len(pols) == 1 else pol
+        image_list = [
+            image.as_posix() for image in outputs.get((file_pol, "image", False), [])
+        ]
         image_lists[pol] = image_list
 
         logger.info(f"Found {len(image_list)} images for {pol=} {ms}.")
 
         for aux in aux_suffixes:
-            aux_list = (
-                sorted(glob(f"{prefix_str}-*[0-9]-{aux}.fits"))
-                if len(pols) == 1 or aux == "psf"
-                else sorted(glob(f"{prefix_str}-*[0-9]-{pol}-{aux}.fits"))
-            )
+            aux_pol = None if aux == "psf" else file_pol
+            aux_list = [
+                aux_image.as_posix()
+                for aux_image in outputs.get((aux_pol, aux, False), [])
+            ]
             aux_lists[(pol, aux)] = aux_list
 
             logger.info(f"Found {len(aux_list)} images for {pol=} {aux=} {ms}.")
@@ -563,7 +617,8 @@ def image_beam(
         ms=ms, prefix=prefix_str, image_lists=image_lists, aux_lists=aux_lists
     )
 
-    logger.debug(f"{image_set=}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"{image_set=}")
 
     return image_set
 
@@ -572,7 +627,7 @@ def image_beam(
 def make_cube(
     pol: str,
     image_set: ImageSet,
-    common_beam_pkl: Path,
+    common_beam: Beam,
     pol_angle_deg: float,
     aux_mode: Optional[str] = None,
 ) -> Tuple[Path, Path]:
@@ -602,36 +657,50 @@ def make_cube(
         create_blanks=True,
         overwrite=True,
     )
+    # Stream the cube back out one channel at a time in FREQ, STOKES, RA, DEC
+    # order, so only a single plane is ever held in memory. The output goes
+    # to a temporary file that replaces the combined cube once complete.
+    tmp_name = new_name.with_name(f"{new_name.name}.tmp")
+    tmp_name.unlink(missing_ok=True)
     with fits.open(new_name, mode="denywrite", memmap=True) as hdu_list:
-        new_header = hdu_list[0].header
-        data_cube = hdu_list[0].data
-
-    # Add pol angle to header
-    new_header["INSTRUMENT_RECEPTOR_ANGLE"] = (
-        pol_angle_deg,
-        "Orig. pol. axis rotation angle in degrees",
-    )
+        hdu = hdu_list[0]
+        new_header = hdu.header.copy()
+        _, nchan, _, _ = hdu.shape
+
+        # Add pol angle to header
+        new_header["INSTRUMENT_RECEPTOR_ANGLE"] = (
+            pol_angle_deg,
+            "Orig. pol. axis rotation angle in degrees",
+        )
 
-    tmp_header = new_header.copy()
-    # Need to swap NAXIS 3 and 4 to make LINMOS happy - booo
-    for a, b in ((3, 4), (4, 3)):
-        new_header[f"CTYPE{a}"] = tmp_header[f"CTYPE{b}"]
-        new_header[f"CRPIX{a}"] = tmp_header[f"CRPIX{b}"]
-        new_header[f"CRVAL{a}"] = tmp_header[f"CRVAL{b}"]
-        new_header[f"CDELT{a}"] = tmp_header[f"CDELT{b}"]
-        new_header[f"CUNIT{a}"] = tmp_header[f"CUNIT{b}"]
-
-    # Cube is currently STOKES, FREQ, RA, DEC - needs to be FREQ, STOKES, RA, DEC
-    data_cube = np.moveaxis(data_cube, 1, 0)
-
-    # Calculate rms noise
-    rmss_arr = mad_std(data_cube, axis=(1, 2, 3), ignore_nan=True)
-
-    # Deserialise beam
-    with open(common_beam_pkl, "rb") as f:
-        common_beam = pickle.load(f)
-    new_header = common_beam.attach_to_header(new_header)
-    fits.writeto(new_name, data_cube, new_header, overwrite=True)
+        tmp_header = new_header.copy()
+        # Need to swap NAXIS 3 and 4 to make LINMOS happy - booo
+        for a, b in ((3, 4), (4, 3)):
+            new_header[f"NAXIS{a}"] = tmp_header[f"NAXIS{b}"]
+            new_header[f"CTYPE{a}"] = tmp_header[f"CTYPE{b}"]
+            new_header[f"CRPIX{a}"] = tmp_header[f"CRPIX{b}"]
+            new_header[f"CRVAL{a}"] = tmp_header[f"CRVAL{b}"]
+            new_header[f"CDELT{a}"] = tmp_header[f"CDELT{b}"]
+            new_header[f"CUNIT{a}"] = tmp_header[f"CUNIT{b}"]
+
+        new_header = common_beam.attach_to_header(new_header)
+        # wsclean images are single precision - keep the cube that way
+        new_header["BITPIX"] = -32
+        for key in ("BSCALE", "BZERO"):
+            new_header.remove(key, ignore_missing=True)
+
+        # Calculate rms noise of each plane as it is written
+        rmss_arr = np.empty(nchan)
+        stream_hdu = fits.StreamingHDU(tmp_name, new_header)
+        try:
+            for chan in range(nchan):
+                plane = hdu.section[:, chan].astype(np.float32, copy=False)
+                rmss_arr[chan] = mad_std(plane, ignore_nan=True)
+                stream_hdu.write(plane)
+        finally:
+            stream_hdu.close()
+
+    os.replace(tmp_name, new_name)
     logger.info(f"Written {new_name}")
 
     # Write out weights
@@ -654,7 +723,7 @@ def make_cube(
 
 
 @task(name="Get Beam", persist_result=True)
-def get_beam(image_set: ImageSet, cutoff: Optional[float]) -> Path:
+def get_beam(image_set: ImageSet, cutoff: Optional[float]) -> Beam:
     """Derive a common resolution across all images within a set of ImageSet
 
     Args:
@@ -664,7 +733,7 @@ def get_beam(image_set: ImageSet, cutoff: Optional[float]) -> Path:
         this are ignored. Defaults to None.
 
     Returns:
-        Path: Path to the pickled beam object
+        Beam: The common beam. A pickled copy is also written to disk for the record.
     """
     logger = get_run_logger()
 
@@ -679,7 +748,12 @@ def get_beam(image_set: ImageSet, cutoff: Optional[float]) -> Path:
     logger.info(f"The length of the image list is: {len(image_list)}")
 
     # Create a unique hash for the beam log filename
-    image_hash = hashlib.md5("".join(image_list).encode()).hexdigest()
+    # Feed the names in one at a time to avoid building one huge string
+    hasher = hashlib.blake2b(digest_size=8)
+    for image in image_list:
+        hasher.update(image.encode())
+        hasher.update(b"\0")
+    image_hash = hasher.hexdigest()
     try:
         common_beam, _ = beamcon_2D.get_common_beam(files=image_list, cutoff=cutoff)
     except Exception as e:
@@ -713,13 +787,13 @@ def get_beam(image_set: ImageSet, cutoff: Optional[float]) -> Path:
         logger.info(f"Creating {common_beam_pkl}")
         pickle.dump(common_beam, f)
 
-    return common_beam_pkl
+    return common_beam
 
 
 @task(name="Smooth ImageSet", persist_result=True)
 def smooth_imageset(
     image_set: ImageSet,
-    common_beam_pkl: Path,
+    common_beam: Beam,
     cutoff: Optional[float] = None,
     aux_mode: Optional[str] = None,
 ) -> ImageSet:
@@ -727,7 +801,7 @@ def smooth_imageset(
 
     Args:
         image_set (ImageSet): Container whose image_list will be convolved to common resolution
-        common_beam_pkl (Path): Location of pickle file with beam description
+        common_beam (Beam): Common beam to convolve the images to
         cutoff (Optional[float], optional): PSF cutoff passed to the beamcon_2D worker. Defaults to None.
         aux_model (Optional[str], optional): The image type in the `aux_lists` property of `image_set` that contains the images to smooth. If
         not set then the `image_lists` property of `image_set` is used. Defaults to None.
@@ -737,11 +811,6 @@ def smooth_imageset(
     # Smooth image
     logger = get_run_logger()
 
-    # Deserialise the beam
-    with open(common_beam_pkl, "rb") as f:
-        logger.info(f"Loading common beam from {common_beam_pkl}")
-        common_beam = pickle.load(f)
-
     logger.info(f"{common_beam=}")
 
     logger.info(f"Smooting {image_set.ms} images")
@@ -759,27 +828,32 @@ def smooth_imageset(
         }
 
     sm_images = {}
+    futures = []
     with ThreadPoolExecutor() as executor:
+        # Fan out every channel image across all pols at once
         for pol, pol_images in images_to_smooth.items():
             logger.info(f"Smoothing {pol=} for {image_set.ms}")
             for img in pol_images:
                 logger.info(f"Smoothing {img}")
-                last_result = executor.submit(
-                    beamcon_2D.beamcon_2d_on_fits,
-                    file=Path(img),
-                    outdir=None,
-                    new_beam=common_beam,
-                    conv_mode="robust",
-                    suffix="conv",
-                    cutoff=cutoff,
+                futures.append(
+                    executor.submit(
+                        beamcon_2D.beamcon_2d_on_fits,
+                        file=Path(img),
+                        outdir=None,
+                        new_beam=common_beam,
+                        conv_mode="robust",
+                        suffix="conv",
+                        cutoff=cutoff,
+                    )
                 )
 
             sm_images[pol] = [
                 image.replace(".fits", ".conv.fits") for image in pol_images
             ]
 
-    # Wait on all the futures
-    _ = last_result.result()
+        # Wait on all the futures so that any failure is raised here
+        for future in futures:
+            _ = future.result()
 
     return ImageSet(
         ms=image_set.ms,
@@ -931,7 +1005,7 @@ def main(
         disable_pol_force_mask_rounds (bool, optional): Disable force mask rounds for polarisation images. Defaults to False.
     """
 
-    simage = get_wsclean(wsclean=wsclean_path)
+    simage = get_wsclean(wsclean=wsclean_path).resolve(strict=True)
 
     logger.info(f"Searching {msdir} for MS matching {ms_glob_pattern}.")
     mslist = sorted(msdir.glob(ms_glob_pattern))
@@ -954,12 +1028,13 @@ def main(
     logger.info(f"Using {temp_dir_images} as temp directory for images")
 
     # Do this in serial since CASA gets upset
+    # The FIELD table is only opened once per MS
     prefixs = {}
     field_idxs = {}
     for ms in tqdm(mslist, "Getting metadata", file=TQDM_OUT):
-        prefix = get_prefix(ms, out_dir)
-        prefixs[ms] = prefix
-        field_idxs[ms] = field_idx_from_ms(ms.resolve(strict=True).as_posix())
+        field_idx, field = field_info_from_ms(ms.resolve(strict=True).as_posix())
+        prefixs[ms] = get_prefix(ms, out_dir, field=field)
+        field_idxs[ms] = field_idx
 
     cube_aux_modes = (None, "residual") if make_residual_cubes else (None,)
 
@@ -995,7 +1070,7 @@ def main(
                 temp_dir_wsclean=temp_dir_wsclean,
                 temp_dir_images=temp_dir_images,
                 prefix=prefixs[ms],
-                simage=simage.resolve(strict=True),
+                simage=simage,
                 robust=robust,
                 pols="I",
                 join_polarizations=False,  # Only do I
@@ -1034,7 +1109,7 @@ def main(
             temp_dir_wsclean=temp_dir_wsclean,
             temp_dir_images=temp_dir_images,
             prefix=prefixs[ms],
-            simage=simage.resolve(strict=True),
+            simage=simage,
             robust=robust,
             pols=pols.replace("I", ""),  # There is no 'I' in polarisation...
             join_polarizations=len(pols) > 1,
@@ -1075,7 +1150,7 @@ def main(
         # Compute the smallest beam that all images can be convolved to.
         # This requires all imaging rounds to be completed, so the total
         # set of ImageSets are first derived before this is called.
-        common_beam_pkl = get_beam.submit(
+        common_beam = get_beam.submit(
             image_set=image_set,
             cutoff=cutoff,
         )
@@ -1089,7 +1164,7 @@ def main(
             # beamwise
             sm_image_set = smooth_imageset.submit(
                 image_set,
-                common_beam_pkl=common_beam_pkl,
+                common_beam=common_beam,
                 cutoff=cutoff,
                 aux_mode=aux_mode,
             )
@@ -1099,7 +1174,7 @@ def main(
                 make_cube.submit(
                     pol=pol,
                     image_set=sm_image_set,
-                    common_beam_pkl=common_beam_pkl,
+                    common_beam=common_beam,
                     pol_angle_deg=pol_angle_deg,
                     aux_mode=aux_mode,
                     wait_for=[sm_image_set],
@@ -168,6 +168,8 @@ def source_database(
     logger.info("Creating index...")
     idx_res = comp_col.create_index("Gaussian_ID")
     logger.info(f"Index created: {idx_res}")
+    idx_res = comp_col.create_index("Source_ID")
+    logger.info(f"Index created: {idx_res}")
 
     return island_insert_res, comp_insert_res
 
@@ -447,6 +449,12 @@ def field_database(
     logger.info("Creating index...")
     idx_res = field_col.create_index("FIELD_NAME")
     logger.info(f"Index created: {idx_res}")
+    # Covers the SELECT=1 lookups made by the pipeline stages
+    idx_res = field_col.create_index([("FIELD_NAME", 1), ("SELECT", 1), ("SBID", 1)])
+    logger.info(f"Index created: {idx_res}")
+    # Covers the SBID validation lookups
+    idx_res = field_col.create_index("SBID")
+    logger.info(f"Index created: {idx_res}")
 
     beam_res = beam_inf(
         database=database,
@@ -6,13 +6,14 @@ import logging
 import os
 import shlex
 import warnings
-from glob import glob
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from pprint import pformat
+from shutil import copyfile
+from subprocess import CalledProcessError
 from typing import Dict, List
 from typing import NamedTuple as Struct
 from typing import Optional, Tuple
-from shutil import copyfile
 
 import astropy.units as u
 import numpy as np
@@ -27,7 +28,7 @@ from spython.main import Client as sclient
 from tqdm.auto import tqdm
 
 from arrakis.logger import TqdmToLogger, UltimateHelpFormatter, logger
-from arrakis.utils.database import get_db, test_db
+from arrakis.utils.database import chunked_bulk_write, get_db, test_db
 from arrakis.utils.pipeline import generic_parser, logo_str, workdir_arg_parser
 
 warnings.filterwarnings(action="ignore", category=SpectralCubeWarning, append=True)
@@ -49,6 +50,38 @@ class ImagePaths(Struct):
     """List of weight paths"""
 
 
+class LinmosResult(Struct):
+    """Result of a LINMOS run, small enough to send back from the workers cheaply"""
+
+    source: str
+    """Source_ID of the island"""
+    field: str
+    """Name of RACS field"""
+    stoke: str
+    """Stokes parameter"""
+    new_file: str
+    """Path to the mosaicked cube, relative to the cutout directory"""
+
+    def to_update(self) -> pymongo.UpdateOne:
+        """Make the database update for this result
+
+        Returns:
+            pymongo.UpdateOne: Mongo update object.
+        """
+        query = {"Source_ID": self.source}
+        newvalues = {
+            "$set": {f"beams.{self.field}.{self.stoke.lower()}_file": self.new_file}
+        }
+        if self.stoke.lower() in ("q", "u"):
+            # A new Q or U mosaic invalidates any FRion-corrected products,
+            # so make sure FRion picks this island up again
+            newvalues["$unset"] = {
+                f"beams.{self.field}.q_file_ion": "",
+                f"beams.{self.field}.u_file_ion": "",
+            }
+        return pymongo.UpdateOne(query, newvalues)
+
+
 @task(name="Find images")
 def find_images(
     field: str,
@@ -65,47 +98,33 @@ def find_images(
         datadir (Path): Data directory.
 
     Raises:
+        ValueError: If an image is not in the island's directory.
         Exception: If no files are found.
 
     Returns:
         ImagePaths: List of images and weights.
     """
-    logger.setLevel(logging.INFO)
     beams = beams_row[1]
     src_name = beams.Source_ID
     field_beams = beams.beams[field]
 
     # First check that the images exist
+    datadir_abs = datadir.resolve()
     image_list: List[Path] = []
-    for bm in list(set(field_beams["beam_list"])):  # Ensure list of beams is unique!
-        imfile = Path(field_beams[f"{stoke.lower()}_beam{bm}_image_file"])
-        assert (
-            imfile.parent.name == src_name
-        ), f"Looking in wrong directory! '{imfile.parent.name}'"
-        new_imfile = datadir.resolve() / imfile
-        image_list.append(new_imfile)
-    image_list = sorted(image_list)
+    weight_list: List[Path] = []
+    # Ensure list of beams is unique!
+    for bm in sorted(set(field_beams["beam_list"])):
+        imfile: str = field_beams[f"{stoke.lower()}_beam{bm}_image_file"]
+        wgtsfile: str = field_beams[f"{stoke.lower()}_beam{bm}_weight_file"]
+        for beam_file in (imfile, wgtsfile):
+            if Path(beam_file).parent.name != src_name:
+                raise ValueError(f"Looking in wrong directory! '{beam_file}'")
+        image_list.append(datadir_abs / imfile)
+        weight_list.append(datadir_abs / wgtsfile)
 
     if len(image_list) == 0:
         raise Exception("No files found. Have you run imaging? Check your prefix?")
 
-    weight_list: List[Path] = []
-    for bm in list(set(field_beams["beam_list"])):  # Ensure list of beams is unique!
-        wgtsfile = Path(field_beams[f"{stoke.lower()}_beam{bm}_weight_file"])
-        assert (
-            wgtsfile.parent.name == src_name
-        ), f"Looking in wrong directory! '{wgtsfile.parent.name}'"
-        new_wgtsfile = datadir.resolve() / wgtsfile
-        weight_list.append(new_wgtsfile)
-    weight_list = sorted(weight_list)
-
-    assert len(image_list) == len(weight_list), "Unequal number of weights and images"
-
-    for im, wt in zip(image_list, weight_list):
-        assert (
-            im.parent.name == wt.parent.name
-        ), "Image and weight are in different areas!"
-
     return ImagePaths(image_list, weight_list)
 
 
@@ -139,6 +158,30 @@ def smooth_images(
     return smooth_dict
 
 
+def stage_holofile(holofile: Optional[Path]) -> Optional[Path]:
+    """Copy the holography file to $MEMDIR (if set) and resolve its path
+
+    Args:
+        holofile (Optional[Path]): Path to the holography file.
+
+    Returns:
+        Optional[Path]: Absolute path to the holography file to use.
+    """
+    if holofile is None:
+        return None
+
+    mem_dir = os.getenv("MEMDIR", None)
+    if mem_dir is not None:
+        logger.info(f"Copying holography file to {mem_dir}")
+        mem_path = Path(mem_dir)
+        holo_copy = mem_path / holofile.name
+        if not holo_copy.exists():
+            copyfile(holofile, holo_copy)
+        holofile = holo_copy
+
+    return holofile.resolve()
+
+
 @task(name="Generate parset")
 def genparset(
     image_paths: ImagePaths,
@@ -152,7 +195,7 @@ def genparset(
         image_paths (ImagePaths): List of images and weights.
         stoke (str): Stokes parameter.
         datadir (Path): Data directory.
-        holofile (Path, optional): Path to the holography file to include in the bind list. Defaults to None.
+        holofile (Path, optional): Absolute path to the (staged) holography file, see `stage_holofile`. Defaults to None.
 
     Raises:
         Exception: If no files are found.
@@ -160,7 +203,6 @@ def genparset(
     Returns:
         str: Path to parset file.
     """
-    logger.setLevel(logging.INFO)
 
     pol_angles_list: List[float] = []
     for im in image_paths.images:
@@ -178,13 +220,16 @@ def genparset(
     alpha = pol_0 - -45 * u.deg
     logger.info(f"Using alpha = {alpha}")
 
-    image_string = f"[{','.join([im.resolve().with_suffix('').as_posix() for im in image_paths.images])}]"
-    weight_string = f"[{','.join([im.resolve().with_suffix('').as_posix() for im in image_paths.weights])}]"
+    # find_images already gives absolute paths under the resolved datadir
+    image_names = [im.with_suffix("").as_posix() for im in image_paths.images]
+    weight_names = [wt.with_suffix("").as_posix() for wt in image_paths.weights]
+    image_string = f"[{','.join(image_names)}]"
+    weight_string = f"[{','.join(weight_names)}]"
 
     parset_dir = datadir.resolve() / image_paths.images[0].parent.name
 
-    first_image = image_paths.images[0].resolve().with_suffix("").as_posix()
-    first_weight = image_paths.weights[0].resolve().with_suffix("").as_posix()
+    first_image = image_names[0]
+    first_weight = weight_names[0]
     linmos_image_str = f"{first_image[:first_image.find('beam')]}linmos"
     linmos_weight_str = f"{first_weight[:first_weight.find('beam')]}linmos"
 
@@ -202,62 +247,130 @@ linmos.weightstate      = Inherent
 
     if holofile is not None:
         logger.info(f"Using holography file {holofile} -- setting removeleakge to true")
-        mem_dir = os.getenv("MEMDIR", None)
-        if mem_dir is not None:
-            logger.info(f"Copying holography file to {mem_dir}")
-            mem_path = Path(mem_dir)
-            holo_copy = mem_path / holofile.name
-            if not holo_copy.exists():
-                copyfile(holofile, holo_copy)
-            holofile = holo_copy
-
         parset += f"""
 linmos.primarybeam      = ASKAP_PB
-linmos.primarybeam.ASKAP_PB.image = {holofile.resolve().as_posix()}
+linmos.primarybeam.ASKAP_PB.image = {holofile.as_posix()}
 linmos.primarybeam.ASKAP_PB.alpha = {alpha.to(u.rad).value}
 linmos.removeleakage    = true
 """
     else:
         logger.warning("No holography file provided - not correcting leakage!")
 
-    with open(parset_file, "w") as f:
-        f.write(parset)
+    # Write then rename, so linmos never sees a partial parset
+    tmp_file = f"{parset_file}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(parset.encode())
+    os.replace(tmp_file, parset_file)
 
     return parset_file
 
 
-@task(name="Run linmos")
-def linmos(
-    parset: Optional[str], fieldname: str, image: str, holofile: Path
-) -> Optional[pymongo.UpdateOne]:
-    """Run linmos
+def get_parset_value(parset: Path, key: str) -> str:
+    """Read a value from a LINMOS parset
 
     Args:
-        parset (str): Path to parset file.
+        parset (Path): Path to parset file.
+        key (str): Parset key, e.g. 'linmos.outname'.
+
+    Raises:
+        KeyError: If the key is not in the parset.
+
+    Returns:
+        str: Value of the key.
+    """
+    with open(parset) as f:
+        for line in f:
+            name, sep, value = line.partition("=")
+            if sep and name.strip() == key:
+                return value.strip()
+    raise KeyError(f"{key} not found in {parset}")
+
+
+def get_linmos_result(parset: Path, fieldname: str) -> LinmosResult:
+    """Check the output of a finished LINMOS run
+
+    Args:
+        parset (Path): Path to parset file.
+        fieldname (str): Name of RACS field.
+
+    Raises:
+        Exception: LINMOS output not found.
+
+    Returns:
+        LinmosResult: Location of the new cube.
+    """
+    workdir = parset.parent
+    source = workdir.name
+    # Parsets are named linmos_{stoke}.in
+    stoke = parset.stem.rsplit("_", 1)[1]
+    log_file = parset.with_suffix(".log")
+
+    # The output name is set in the parset, so there's no need to search for it
+    outname = get_parset_value(parset, "linmos.outname")
+
+    new_path = Path(f"{outname}.fits")
+    if not new_path.exists():
+        raise Exception(f"LINMOS file not found! -- check {log_file}?")
+
+    # Store the path relative to the cutout directory
+    new_file = f"{new_path.parent.name}/{new_path.name}"
+
+    logger.info(f"Cube now in {workdir}/{new_path.name}")
+
+    return LinmosResult(source=source, field=fieldname, stoke=stoke, new_file=new_file)
+
+
+# Marker printed by the batch script for each failed linmos run
+LINMOS_FAILED = "LINMOS_FAILED"
+
+
+@task(name="Run linmos batch")
+def linmos_batch(
+    parsets: List[Optional[str]], fieldname: str, image: str, holofile: Path
+) -> List[Optional[LinmosResult]]:
+    """Run linmos on a set of parsets within a single container
+
+    Args:
+        parsets (List[Optional[str]]): Paths to parset files. These must share a root directory.
         fieldname (str): Name of RACS field.
         image (str): Name of Yandasoft image.
         holofile (Path): Path to the holography file to include in the bind list.
-        verbose (bool, optional): Verbose output. Defaults to False.
 
     Raises:
         Exception: If LINMOS fails.
         Exception: LINMOS output not found.
 
     Returns:
-        pymongo.UpdateOne: Mongo update object.
+        List[Optional[LinmosResult]]: LINMOS results, `None` where no parset was given.
     """
-    logger.setLevel(logging.INFO)
-
-    if parset is None:
-        return
-
-    workdir = os.path.dirname(parset)
-    rootdir = os.path.split(workdir)[0]
-    parset_name = os.path.basename(parset)
-    source = os.path.basename(workdir)
-    stoke = parset_name[parset_name.find(".in") - 1]
-    log_file = parset.replace(".in", ".log")
-    linmos_command = shlex.split(f"linmos -c {parset}")
+    parset_paths = [Path(parset) for parset in parsets if parset is not None]
+    if len(parset_paths) == 0:
+        return [None for _ in parsets]
+
+    rootdir = parset_paths[0].parent.parent
+    assert all(
+        parset.parent.parent == rootdir for parset in parset_paths
+    ), "Parsets do not share a root directory!"
+
+    # Remove outputs of any earlier run, so a failed run can't leave a stale
+    # cube that passes the check in `get_linmos_result`
+    for parset in parset_paths:
+        for key in ("linmos.outname", "linmos.outweight"):
+            Path(f"{get_parset_value(parset, key)}.fits").unlink(missing_ok=True)
+
+    # Launch the container once and run each parset inside it. Each run
+    # writes its own log, and a failure doesn't stop the others, but is
+    # reported and makes the container exit non-zero.
+    commands = ["rc=0"]
+    for parset in parset_paths:
+        parset_str = shlex.quote(parset.as_posix())
+        log_str = shlex.quote(parset.with_suffix(".log").as_posix())
+        commands.append(
+            f"linmos -c {parset_str} > {log_str} 2>&1 "
+            f"|| {{ echo {LINMOS_FAILED} {parset_str}; rc=1; }}"
+        )
+    commands.append("exit $rc")
+    linmos_command = ["sh", "-c", "; ".join(commands)]
 
     holo_folder = holofile.parent
 
@@ -269,29 +382,50 @@ def linmos(
         quiet=False,
         stream=True,
     )
-    with open(log_file, "w") as f:
+    # We could log this, but it's a lot of output
+    # We seem to be DDoS'ing the Prefect server
+    failed: List[str] = []
+    try:
         for line in output:
-            # We could log this, but it's a lot of output
-            # We seem to be DDoS'ing the Prefect server
-            # logger.info(line)
-            f.write(line)
+            if line.startswith(LINMOS_FAILED):
+                failed.append(line[len(LINMOS_FAILED) :].strip())
+    except CalledProcessError as e:
+        if len(failed) == 0:
+            raise e
+    if len(failed) > 0:
+        raise Exception(f"LINMOS failed for parsets: {failed} -- check their logs")
+
+    return [
+        None
+        if parset is None
+        else get_linmos_result(parset=Path(parset), fieldname=fieldname)
+        for parset in parsets
+    ]
 
-    new_files = glob(f"{workdir}/*.cutout.image.restored.{stoke.lower()}*.linmos.fits")
 
-    if len(new_files) != 1:
-        raise Exception(f"LINMOS file not found! -- check {log_file}?")
-
-    new_file = os.path.abspath(new_files[0])
-    outer = os.path.basename(os.path.dirname(new_file))
-    inner = os.path.basename(new_file)
-    new_file = os.path.join(outer, inner)
+@task(name="Run linmos")
+def linmos(
+    parset: Optional[str], fieldname: str, image: str, holofile: Path
+) -> Optional[pymongo.UpdateOne]:
+    """Run linmos
 
-    logger.info(f"Cube now in {workdir}/{inner}")
+    Args:
+        parset (str): Path to parset file.
+        fieldname (str): Name of RACS field.
+        image (str): Name of Yandasoft image.
+        holofile (Path): Path to the holography file to include in the bind list.
 
-    query = {"Source_ID": source}
-    newvalues = {"$set": {f"beams.{fieldname}.{stoke.lower()}_file": new_file}}
+    Raises:
+        Exception: If LINMOS fails.
+        Exception: LINMOS output not found.
 
-    return pymongo.UpdateOne(query, newvalues)
+    Returns:
+        pymongo.UpdateOne: Mongo update object.
+    """
+    result = linmos_batch.fn(
+        parsets=[parset], fieldname=fieldname, image=image, holofile=holofile
+    )[0]
+    return None if result is None else result.to_update()
 
 
 def get_yanda(version="1.3.0") -> str:
@@ -308,40 +442,54 @@ def get_yanda(version="1.3.0") -> str:
     return image
 
 
-# We reduce the inner loop to a serial call
+# We reduce the inner loop to a serial call over a batch of islands
 # This is to avoid overwhelming the Prefect server
 @task(name="LINMOS loop")
 def serial_loop(
     field: str,
-    beams_row: Tuple[int, pd.Series],
+    beams_rows: List[Tuple[int, pd.Series]],
     stokeslist: List[str],
     cutdir: Path,
     holofile: Path,
     image: Path,
-) -> List[Optional[pymongo.UpdateOne]]:
-    results = []
-    for stoke in stokeslist:
+) -> List[Optional[LinmosResult]]:
+    # Work out the shared paths once for the whole batch
+    cutdir = cutdir.resolve()
+    holofile = stage_holofile(holofile)
+
+    def _make_parset(beams_row: Tuple[int, pd.Series], stoke: str) -> str:
         image_path = find_images.fn(
             field=field,
             beams_row=beams_row,
             stoke=stoke.capitalize(),
             datadir=cutdir,
         )
-        parset = genparset.fn(
+        return genparset.fn(
             image_paths=image_path,
             stoke=stoke.capitalize(),
             datadir=cutdir,
             holofile=holofile,
         )
-        result = linmos.fn(
-            parset=parset,
-            fieldname=field,
-            image=str(image),
-            holofile=holofile,
+
+    # Writing the parsets is just header reads and small writes, so
+    # overlap them on threads
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        parsets = list(
+            executor.map(
+                _make_parset,
+                [beams_row for beams_row in beams_rows for _ in stokeslist],
+                [stoke for _ in beams_rows for stoke in stokeslist],
+            )
         )
-        results.append(result)
 
-    return results
+    # All the parsets in the batch share the cutout directory, so they
+    # can run in a single container
+    return linmos_batch.fn(
+        parsets=parsets,
+        fieldname=field,
+        image=str(image),
+        holofile=holofile,
+    )
 
 
 @flow(name="LINMOS")
@@ -358,6 +506,7 @@ def main(
     yanda_img: Optional[Path] = None,
     stokeslist: Optional[List[str]] = None,
     limit: Optional[int] = None,
+    batch_size: int = 10,
 ) -> None:
     """LINMOS flow
 
@@ -372,9 +521,12 @@ def main(
         yanda_img (Path, optional): Path to a yandasoft singularirt image. If `None`, the container version `yanda` will be downloaded. Defaults to None.
         stokeslist (List[str], optional): Stokes parameters to process. Defaults to None.
         limit (int, optional): Limit the number of islands to process. Defaults to None.
+        batch_size (int, optional): Number of islands per LINMOS task. Defaults to 10.
     """
     # Setup singularity image
     image = get_yanda(version=yanda) if yanda_img is None else yanda_img
+    # Resolve once here rather than in every task
+    image = Path(image).resolve()
 
     logger.info(f"The yandasoft image is {image=}")
 
@@ -394,9 +546,12 @@ def main(
 
     logger.info(f"The query is {query=}")
 
-    island_ids: List[str] = sorted(beams_col.distinct("Source_ID", query))
+    # Only pull the field's beam entries - that's all LINMOS reads
     big_beams = pd.DataFrame(
-        beams_col.find({"Source_ID": {"$in": island_ids}}).sort("Source_ID")
+        beams_col.find(
+            query,
+            {"_id": 0, "Source_ID": 1, f"beams.{field}": 1},
+        ).sort("Source_ID")
     )
 
     if limit is not None:
@@ -405,16 +560,20 @@ def main(
 
     logger.info(f"Running LINMOS on {len(big_beams)} islands")
 
+    # Submit islands in batches to cut down on per-task overhead
+    beams_rows = list(big_beams.iterrows())
+    n_batches = max(1, len(beams_rows) // batch_size)
+    batch_bounds = np.linspace(0, len(beams_rows), n_batches + 1).astype(int)
     results = []
-    for beams_row in tqdm(
-        big_beams.iterrows(),
-        total=len(big_beams),
+    for start, stop in tqdm(
+        zip(batch_bounds[:-1], batch_bounds[1:]),
+        total=n_batches,
         desc="Submitting tasks for LINMOS",
         file=TQDM_OUT,
     ):
         sub_results = serial_loop.submit(
             field=field,
-            beams_row=beams_row,
+            beams_rows=beams_rows[start:stop],
             stokeslist=stokeslist,
             cutdir=cutdir,
             holofile=holofile,
@@ -422,13 +581,17 @@ def main(
         )
         results.append(sub_results)
 
-    updates_lists: List[list] = [f.result() for f in results]
-    # Flatten
-    updates = [u for ul in updates_lists for u in ul]
-    updates = [u for u in updates if u is not None]
+    # All batches are already submitted, so waiting on them in order
+    # doesn't hold any back. Flatten as they resolve.
+    updates: List[pymongo.UpdateOne] = [
+        result.to_update()
+        for future in results
+        for result in future.result()
+        if result is not None
+    ]
     logger.info("Updating database...")
-    db_res = beams_col.bulk_write(updates, ordered=False)
-    logger.info(pformat(db_res.bulk_api_result))
+    db_res = chunked_bulk_write(beams_col, updates, max_workers=4)
+    logger.info(pformat(db_res))
 
     logger.info("LINMOS Done!")
 
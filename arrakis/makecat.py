@@ -707,7 +707,8 @@ def get_integration_time(
             subset=["FIELD_NAME"]
         )
 
-    logger.debug(f"Returned results: {tint_df=}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug(f"Returned results: {tint_df=}")
 
     tints = tint_df.loc[field_names]["SCAN_TINT"].values * u.s
 
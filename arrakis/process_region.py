@@ -4,10 +4,10 @@
 import argparse
 import logging
 import os
+from importlib import resources
 from pathlib import Path
 
 import configargparse
-import pkg_resources
 import yaml
 from astropy.time import Time
 from prefect import flow
@@ -144,8 +144,8 @@ def main(args: configargparse.Namespace) -> None:
         args (configargparse.Namespace): Command line arguments.
     """
     if args.dask_config is None:
-        config_dir = pkg_resources.resource_filename("arrakis", "configs")
-        args.dask_config = os.path.join(config_dir, "default.yaml")
+        config_dir = resources.files("arrakis.configs")
+        args.dask_config = str(config_dir / "default.yaml")
 
     if args.outfile is None:
         args.outfile = f"{args.merge_name}.pipe.test.fits"
@@ -156,7 +156,7 @@ def main(args: configargparse.Namespace) -> None:
         password=args.password,
     )
 
-    args_yaml = yaml.dump(vars(args))
+    args_yaml = yaml.dump(vars(args), Dumper=process_spice.Dumper)
     args_yaml_f = os.path.abspath(f"{args.merge_name}-config-{Time.now().fits}.yaml")
     logger.info(f"Saving config to '{args_yaml_f}'")
     with open(args_yaml_f, "w") as f:
@@ -30,6 +30,10 @@ from arrakis.utils.database import test_db
 from arrakis.utils.pipeline import generic_parser, logo_str, workdir_arg_parser
 from arrakis.validate import validation_parser
 
+# Prefer the libyaml bindings where available
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+Dumper = getattr(yaml, "CDumper", yaml.Dumper)
+
 
 @flow(name="Combining+Synthesis on Arrakis", retries=3, retry_delay_seconds=600)
 def process_spice(args, host: str, task_runner: BaseTaskRunner) -> None:
@@ -99,6 +103,7 @@ def process_spice(args, host: str, task_runner: BaseTaskRunner) -> None:
             ionex_formatter=args.ionex_formatter,
             ionex_predownload=args.ionex_predownload,
             limit=args.limit,
+            force=args.frion_force,
         )
         if not args.skip_frion
         else previous_future
@@ -207,7 +212,7 @@ def save_args(args: configargparse.Namespace) -> Path:
     Returns:
         Path: Output path of the saved file
     """
-    args_yaml = yaml.dump(vars(args))
+    args_yaml = yaml.dump(vars(args), Dumper=Dumper)
     args_yaml_f = os.path.abspath(f"{args.field}-config-{Time.now().fits}.yaml")
     logger.info(f"Saving config to '{args_yaml_f}'")
     with open(args_yaml_f, "w") as f:
@@ -237,7 +242,14 @@ def create_dask_runner(
 
     with open(dask_config) as f:
         logger.info(f"Loading {dask_config}")
-        yaml_config: dict = yaml.safe_load(f)
+        yaml_config: dict = yaml.load(f, Loader=SafeLoader)
+
+    # Connect to an already running scheduler (e.g. an alternative,
+    # protocol-compatible implementation) rather than starting a cluster
+    address = yaml_config.get("address", None)
+    if address is not None:
+        logger.info(f"Connecting to existing Dask scheduler at {address}")
+        return DaskTaskRunner(address=address)
 
     cluster_class_str = yaml_config.get("cluster_class", "distributed.LocalCluster")
     cluster_kwargs = yaml_config.get("cluster_kwargs", {})
@@ -8,7 +8,6 @@ import warnings
 from pathlib import Path
 from pprint import pformat
 from typing import Optional
-from shutil import copyfile
 
 import numpy as np
 from matplotlib import pyplot as plt
@@ -27,6 +26,7 @@ from arrakis.utils.database import (
     test_db,
     validate_sbid_field_pair,
 )
+from arrakis.utils.io import try_link
 from arrakis.utils.pipeline import generic_parser, logo_str, workdir_arg_parser
 
 matplotlib.use("Agg")
@@ -130,7 +130,7 @@ def rmclean1d(
         plotdir = outdir / "plots"
         plot_files = list(fdfFile.parent.glob("*.pdf"))
         for plot_file in plot_files:
-            copyfile(plot_file, plotdir / plot_file.name)
+            try_link(plot_file, plotdir / plot_file.name)
 
     # Load into Mongo
     myquery = {
@@ -8,7 +8,6 @@ import traceback
 import warnings
 from pathlib import Path
 from pprint import pformat
-from shutil import copyfile
 from typing import List
 from typing import NamedTuple as Struct
 from typing import Optional, Tuple, Union
@@ -42,6 +41,7 @@ from arrakis.utils.database import (
 )
 from arrakis.utils.fitsutils import getfreq
 from arrakis.utils.fitting import fit_pl, fitted_mean, fitted_std
+from arrakis.utils.io import try_link
 from arrakis.utils.pipeline import generic_parser, logo_str, workdir_arg_parser
 
 matplotlib.use("Agg")
@@ -633,7 +633,7 @@ def rmsynthoncut1d(
         plotdir = outdir / "plots"
         plot_files = list(filtered_stokes_spectra.i.filename.parent.glob("*.pdf"))
         for plot_file in plot_files:
-            copyfile(plot_file, plotdir / plot_file.name)
+            try_link(plot_file, plotdir / plot_file.name)
 
     # Update I, Q, U noise from data
     for stokes in "qu" if noStokesI else "iqu":
@@ -688,7 +688,9 @@ def rmsynthoncut1d(
     head_dict.pop("", None)
     if "COMMENT" in head_dict.keys():
         head_dict["COMMENT"] = str(head_dict["COMMENT"])
-    logger.debug(f"Heading for {cname} is {pformat(head_dict)}")
+    if logger.isEnabledFor(logging.DEBUG):
+        # Don't pretty-print every component's header unless it will be shown
+        logger.debug(f"Heading for {cname} is {pformat(head_dict)}")
 
     outer_dir = os.path.basename(os.path.dirname(filtered_stokes_spectra.i.filename))
     newvalues = {
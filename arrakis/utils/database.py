@@ -2,11 +2,15 @@
 """Database utilities"""
 
 import warnings
-from typing import Optional, Tuple, Union
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from importlib.util import find_spec
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import pymongo
 from astropy.utils.exceptions import AstropyWarning
 from pymongo.collection import Collection
+from pymongo.write_concern import WriteConcern
 from spectral_cube.utils import SpectralCubeWarning
 
 from arrakis.logger import logger
@@ -15,6 +19,38 @@ warnings.filterwarnings(action="ignore", category=SpectralCubeWarning, append=Tr
 warnings.simplefilter("ignore", category=AstropyWarning)
 
 
+def validate_sbid_field_pairs(
+    pairs: List[Tuple[str, int]], field_col: Collection
+) -> List[bool]:
+    """Validate several field and sbid pairs with a single query
+
+    Args:
+        pairs (List[Tuple[str, int]]): Field name and SBID pairs.
+        field_col (Collection): Field collection.
+
+    Raises:
+        ValueError: If any SBID is not in the database.
+
+    Returns:
+        List[bool]: Whether each pair is valid, in the same order as `pairs`.
+    """
+    sbids = list({sbid for _, sbid in pairs})
+    logger.info(f"Validating {len(pairs)} field name and SBID pair(s)")
+    cursor = field_col.find(
+        {"SBID": {"$in": sbids}}, {"_id": 0, "SBID": 1, "FIELD_NAME": 1}
+    )
+    # Keep the first document per SBID, as `find_one` would
+    field_names: Dict[int, str] = {}
+    for doc in cursor:
+        field_names.setdefault(doc["SBID"], doc["FIELD_NAME"])
+
+    missing = [sbid for sbid in sbids if sbid not in field_names]
+    if missing:
+        raise ValueError(f"SBID(s) {missing} not found in database")
+
+    return [field_names[sbid] == field_name for field_name, sbid in pairs]
+
+
 def validate_sbid_field_pair(field_name: str, sbid: int, field_col: Collection) -> bool:
     """Validate field and sbid pair
 
@@ -27,18 +63,88 @@ def validate_sbid_field_pair(field_name: str, sbid: int, field_col: Collection)
         bool: If field name and sbid pair is valid.
     """
     logger.info(f"Validating field name and SBID pair: {field_name}, {sbid}")
-    field_data: Optional[dict] = field_col.find_one({"SBID": sbid})
-    if field_data is None:
-        raise ValueError(f"SBID {sbid} not found in database")
+    return validate_sbid_field_pairs([(field_name, sbid)], field_col)[0]
+
+
+def chunked_bulk_write(
+    collection: Collection,
+    requests: List[Any],
+    chunk_size: int = 1_000,
+    max_workers: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Write requests to a collection in concurrent, unordered chunks
 
-    return field_data["FIELD_NAME"] == field_name
+    Args:
+        collection (Collection): Collection to write to.
+        requests (List[Any]): Pymongo write operations (e.g. UpdateOne).
+        chunk_size (int, optional): Operations per bulk write. Defaults to 1_000.
+        max_workers (int, optional): Number of writer threads. Defaults to None.
+
+    Returns:
+        Dict[str, Any]: Combined ``bulk_api_result`` of all chunks.
+    """
+    # Don't wait on the journal for every chunk
+    fast_col = collection.with_options(write_concern=WriteConcern(w=1, j=False))
+    chunks = [
+        requests[i : i + chunk_size] for i in range(0, len(requests), chunk_size)
+    ]
 
+    if len(chunks) == 0:
+        logger.warning("No requests to write!")
+        return combine_bulk_results([])
 
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(
+                fast_col.bulk_write,
+                chunk,
+                ordered=False,
+                bypass_document_validation=True,
+            )
+            for chunk in chunks
+        ]
+        results = [future.result().bulk_api_result for future in futures]
+
+    return combine_bulk_results(results)
+
+
+def combine_bulk_results(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum the counters of several ``bulk_api_result`` dicts
+
+    Args:
+        results (List[Dict[str, Any]]): Results from separate bulk writes.
+
+    Returns:
+        Dict[str, Any]: Combined result.
+    """
+    summary: Dict[str, Any] = {
+        "writeErrors": [],
+        "writeConcernErrors": [],
+        "nInserted": 0,
+        "nUpserted": 0,
+        "nMatched": 0,
+        "nModified": 0,
+        "nRemoved": 0,
+        "upserted": [],
+    }
+    for result in results:
+        for key, val in result.items():
+            if isinstance(val, list):
+                summary.setdefault(key, []).extend(val)
+            else:
+                summary[key] = summary.get(key, 0) + val
+
+    return summary
+
+
+@lru_cache(maxsize=8)
 def test_db(
     host: str, username: Union[str, None] = None, password: Union[str, None] = None
 ) -> bool:
     """Test connection to MongoDB
 
+    A successful check is remembered for the life of the process.
+
     Args:
         host (str): Mongo host IP.
         username (str, optional): Mongo username. Defaults to None.
@@ -54,21 +160,75 @@ def test_db(
     """
     logger.info("Testing MongoDB connection...")
     # default connection (ie, local)
-    with pymongo.MongoClient(
+    # Use the shared client, so the connection made here is reused later
+    dbclient = get_client(host=host, username=username, password=password)
+    try:
+        dbclient.admin.command("ping")
+    except pymongo.errors.ServerSelectionTimeoutError:
+        raise Exception("Please ensure 'mongod' is running")
+
+    logger.info("MongoDB connection succesful!")
+
+    return True
+
+
+def _wire_compressors() -> List[str]:
+    """Wire compressors to offer the server, best first
+
+    zstd and snappy need optional packages, so only offer them when those are
+    installed (pymongo would otherwise warn on every client). zlib is always
+    available.
+
+    Returns:
+        List[str]: Compressor names
+    """
+    compressors = []
+    if find_spec("zstandard") is not None:
+        compressors.append("zstd")
+    if find_spec("snappy") is not None:
+        compressors.append("snappy")
+    compressors.append("zlib")
+    return compressors
+
+
+@lru_cache(maxsize=None)
+def get_client(
+    host: str,
+    username: Union[str, None] = None,
+    password: Union[str, None] = None,
+) -> pymongo.MongoClient:
+    """Get a MongoClient, reusing one per host and user in each process
+
+    MongoClient is thread-safe and pools its own connections, so there is
+    no need to reconnect and re-authenticate for every collection.
+
+    Args:
+        host (str): Mongo host IP.
+        username (str, optional): Username. Defaults to None.
+        password (str, optional): Password. Defaults to None.
+
+    Returns:
+        pymongo.MongoClient: Shared client
+    """
+    return pymongo.MongoClient(
         host=host,
         connect=False,
         username=username,
         password=password,
         authMechanism="SCRAM-SHA-256",
-    ) as dbclient:  # type: pymongo.MongoClient
-        try:
-            dbclient.list_database_names()
-        except pymongo.errors.ServerSelectionTimeoutError:
-            raise Exception("Please ensure 'mongod' is running")
-
-        logger.info("MongoDB connection succesful!")
-
-    return True
+        appname="arrakis",
+        # The server picks the first of these it also supports
+        compressors=_wire_compressors(),
+        zlibCompressionLevel=3,
+        # Fail fast on unreachable servers, but let long queries and bulk
+        # writes finish. Idle pooled sockets are kept alive by pymongo itself.
+        connectTimeoutMS=20_000,
+        serverSelectionTimeoutMS=30_000,
+        socketTimeoutMS=600_000,
+        heartbeatFrequencyMS=30_000,
+        retryWrites=True,
+        retryReads=True,
+    )
 
 
 def get_db(
@@ -76,6 +236,7 @@ def get_db(
     epoch: int,
     username: Union[str, None] = None,
     password: Union[str, None] = None,
+    ensure_indexes: bool = False,
 ) -> Tuple[Collection, Collection, Collection]:
     """Get MongoDBs
 
@@ -83,21 +244,24 @@ def get_db(
         host (str): Mongo host IP.
         username (str, optional): Username. Defaults to None.
         password (str, optional): Password. Defaults to None.
+        ensure_indexes (bool, optional): Create the indexes used by the pipeline
+            queries, if missing. Only needed once per run, so leave this off in
+            tasks. Defaults to False.
 
     Returns:
         Tuple[Collection, Collection, Collection]: beams_col, island_col, comp_col
     """
-    dbclient = pymongo.MongoClient(
-        host=host,
-        connect=True,
-        username=username,
-        password=password,
-        authMechanism="SCRAM-SHA-256",
-    )
+    dbclient = get_client(host=host, username=username, password=password)
     mydb = dbclient[f"arrakis_epoch_{epoch}"]  # Create/open database
     comp_col = mydb["components"]  # Create/open collection
     island_col = mydb["islands"]  # Create/open collection
     beams_col = mydb["beams"]  # Create/open collection
+    if ensure_indexes:
+        # create_index is a no-op if the index already exists
+        beams_col.create_index("Source_ID")
+        island_col.create_index("Source_ID")
+        comp_col.create_index("Source_ID")
+        comp_col.create_index("Gaussian_ID")
     return beams_col, island_col, comp_col
 
 
@@ -112,13 +276,7 @@ def get_field_db(host: str, epoch: int, username=None, password=None) -> Collect
     Returns:
         pymongo.Collection: beams_col, island_col, comp_col
     """
-    dbclient = pymongo.MongoClient(
-        host=host,
-        connect=False,
-        username=username,
-        password=password,
-        authMechanism="SCRAM-SHA-256",
-    )  # type: pymongo.MongoClient
+    dbclient = get_client(host=host, username=username, password=password)
     mydb = dbclient[f"arrakis_epoch_{epoch}"]  # Create/open database
     field_col = mydb["fields"]  # Create/open collection
     return field_col
@@ -135,13 +293,7 @@ def get_beam_inf_db(host: str, epoch: int, username=None, password=None) -> Coll
     Returns:
         pymongo.Collection: beams_col, island_col, comp_col
     """
-    dbclient = pymongo.MongoClient(
-        host=host,
-        connect=False,
-        username=username,
-        password=password,
-        authMechanism="SCRAM-SHA-256",
-    )  # type: pymongo.MongoClient
+    dbclient = get_client(host=host, username=username, password=password)
     mydb = dbclient[f"arrakis_epoch_{epoch}"]  # Create/open database
     beam_inf_col = mydb["beam_inf"]  # Create/open collection
     return beam_inf_col
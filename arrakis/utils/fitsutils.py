@@ -1,10 +1,11 @@
 #!/usr/bin/env python
 """FITS utilities"""
 
+import os
+import re
 import warnings
-from glob import glob
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import astropy.units as u
 import numpy as np
@@ -21,6 +22,9 @@ from arrakis.utils.io import gettable
 warnings.filterwarnings(action="ignore", category=SpectralCubeWarning, append=True)
 warnings.simplefilter("ignore", category=AstropyWarning)
 
+# image.restored.{stokes}.*contcube*linmos.fits
+LINMOS_CUBE_RE = re.compile(r"image\.restored\.([iquv])\..*contcube.*linmos\.fits$")
+
 
 def head2dict(h: fits.Header) -> Dict[str, Any]:
     """Convert FITS header to a dict.
@@ -36,12 +40,7 @@ def head2dict(h: fits.Header) -> Dict[str, Any]:
         data (dict): The FITS head converted to a dict.
 
     """
-    data = {}
-    for c in h.__dict__["_cards"]:
-        if c[0] == "":
-            continue
-        data[c[0]] = c[1]
-    return data
+    return {c.keyword: c.value for c in h.cards if c.keyword != ""}
 
 
 def fix_header(cutout_header: fits.Header, original_header: fits.Header) -> fits.Header:
@@ -58,8 +57,10 @@ def fix_header(cutout_header: fits.Header, original_header: fits.Header) -> fits
     axis_orig = find_freq_axis(original_header)
     fixed_header = cutout_header.copy()
     if axis_cut != axis_orig:
+        suffix = str(axis_cut)
         for key, val in cutout_header.items():
-            if key[-1] == str(axis_cut):
+            # endswith also skips blank keywords safely
+            if key.endswith(suffix):
                 fixed_header[f"{key[:-1]}{axis_orig}"] = val
                 fixed_header[key] = original_header[key]
 
@@ -70,6 +71,7 @@ def getfreq(
     cube: Union[str, Path],
     outdir: Optional[Path] = None,
     filename: Union[str, Path, None] = None,
+    fmt: str = "txt",
 ) -> Union[u.Quantity, Tuple[u.Quantity, Path]]:
     """Get list of frequencies from FITS data.
 
@@ -86,16 +88,23 @@ def getfreq(
         filename (str): Name of frequency list file. Requires 'outdir'
             to also be specified.
 
+        fmt (str): Format of the frequency list file. Either 'txt' (plain
+            text, in Hz) or 'npy' (binary NumPy array, in Hz).
+
         verbose (bool): Whether to print messages.
 
     Returns:
         freq (list): Frequencies of each channel in the input cube.
 
     """
-    with fits.open(cube, memmap=True, mode="denywrite") as hdulist:
-        hdu = hdulist[0]
-        hdr = hdu.header
-        data = hdu.data
+    # Only the header is needed - don't touch the data
+    hdr = fits.getheader(cube, ext=0, memmap=False)
+    # Length of the spectral axis. find_freq_axis returns 0 if there is
+    # no FREQ axis, in which case assume the last FITS axis.
+    freq_axis = find_freq_axis(hdr)
+    if freq_axis == 0:
+        freq_axis = hdr["NAXIS"]
+    nchan = hdr[f"NAXIS{freq_axis}"]
 
     # Two problems. The default 'UTC' stored in 'TIMESYS' is
     # incompatible with the TIME_SCALE checks in astropy.
@@ -107,15 +116,23 @@ def getfreq(
             del hdr[k]
 
     wcs = WCS(hdr)
-    freq: u.Quantity = wcs.spectral.pixel_to_world(np.arange(data.shape[0]))
+    freq: u.Quantity = wcs.spectral.pixel_to_world(np.arange(nchan))
 
     # Write to file if outdir is specified
     if outdir is None:
         return freq
 
-    outfile = outdir / filename if filename is not None else outdir / "frequencies.txt"
+    if fmt not in ("txt", "npy"):
+        raise ValueError(f"Unknown frequency file format '{fmt}'")
+    outfile = (
+        outdir / filename if filename is not None else outdir / f"frequencies.{fmt}"
+    )
     logger.info(f"Saving to {outfile}")
-    np.savetxt(outfile, np.array(freq))
+    freq_hz = np.asarray(freq.to(u.Hz).value)
+    if fmt == "npy":
+        np.save(outfile, freq_hz)
+    else:
+        np.savetxt(outfile, freq_hz)
     return freq, outfile
 
 
@@ -140,12 +157,20 @@ def getdata(cubedir="./", tabledir="./", mapdata=None, verbose=True):
 
     if tabledir[-1] == "/":
         tabledir = tabledir[:-1]
-    # Glob out the necessary files
-    # Data cubes
-    icubes = glob(f"{cubedir}/image.restored.i.*contcube*linmos.fits")
-    qcubes = glob(f"{cubedir}/image.restored.q.*contcube*linmos.fits")
-    ucubes = glob(f"{cubedir}/image.restored.u.*contcube*linmos.fits")
-    vcubes = glob(f"{cubedir}/image.restored.v.*contcube*linmos.fits")
+    # Find the necessary files
+    # Data cubes - sort all Stokes in one pass over the directory
+    cube_files: Dict[str, List[str]] = {"i": [], "q": [], "u": [], "v": []}
+    with os.scandir(cubedir) as entries:
+        for entry in entries:
+            match = LINMOS_CUBE_RE.match(entry.name)
+            if match is not None:
+                cube_files[match.group(1)].append(f"{cubedir}/{entry.name}")
+    for files in cube_files.values():
+        files.sort()
+    icubes = cube_files["i"]
+    qcubes = cube_files["q"]
+    ucubes = cube_files["u"]
+    vcubes = cube_files["v"]
 
     cubes = [icubes, qcubes, ucubes, vcubes]
     # Selavy images
@@ -169,12 +194,12 @@ def getdata(cubedir="./", tabledir="./", mapdata=None, verbose=True):
     else:
         v_cube = None
     # Mask out using Stokes I == 0 -- seems to be the current fill value
-    mask = ~(i_cube == 0 * u.jansky / u.beam)
-    i_cube = i_cube.with_mask(mask)
-    mask = ~(q_cube == 0 * u.jansky / u.beam)
-    q_cube = q_cube.with_mask(mask)
-    mask = ~(u_cube == 0 * u.jansky / u.beam)
-    u_cube = u_cube.with_mask(mask)
+    # The masks are lazy comparisons, so build the fill value once and skip
+    # the extra inversion layer
+    zero = 0 * u.jansky / u.beam
+    i_cube = i_cube.with_mask(i_cube != zero)
+    q_cube = q_cube.with_mask(q_cube != zero)
+    u_cube = u_cube.with_mask(u_cube != zero)
 
     datadict = {
         "i_tab": i_tab,
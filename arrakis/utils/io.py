@@ -8,6 +8,7 @@ import warnings
 from glob import glob
 from pathlib import Path
 import shlex
+import shutil
 import subprocess as sp
 from typing import Tuple
 
@@ -77,6 +78,29 @@ def try_symlink(src: str, dst: str, verbose=True):
         logger.info(f"Symlink '{dst}' exists.")
 
 
+def try_link(src: PathLike, dst: PathLike) -> None:
+    """Hard link a file into place, replacing any existing file
+
+    Falls back to a copy (which uses `os.sendfile` on Linux) if the
+    files are on different filesystems.
+
+    Args:
+        src (PathLike): Source path
+        dst (PathLike): Destination path
+    """
+    try:
+        os.unlink(dst)
+    except FileNotFoundError:
+        pass
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        # Another worker linked the same file in the meantime
+        pass
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
 def try_mkdir(dir_path: str, verbose=True):
     """Create directory if it doesn't exist
 
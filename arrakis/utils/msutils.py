@@ -4,7 +4,7 @@
 import copy
 import warnings
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Tuple
 
 import astropy.units as u
 from astropy.utils.exceptions import AstropyWarning
@@ -85,6 +85,18 @@ def field_name_from_ms(ms: str) -> str:
     return name
 
 
+def field_info_from_ms(ms: str) -> Tuple[int, str]:
+    """Get the field index and name from MS metadata in a single table read"""
+    with table(f"{ms}/FIELD", readonly=True, ack=False) as field:
+        idxs = list(field.SOURCE_ID)
+        names = list(field.NAME)
+    assert len(idxs) == 1 or all(
+        [idx == idxs[0] for idx in idxs]
+    ), "More than one field in MS"
+    assert len(names) == 1, "More than one field in MS"
+    return idxs[0], names[0]
+
+
 def wsclean(
     mslist: list,
     use_mpi: bool,
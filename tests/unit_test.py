@@ -1,6 +1,8 @@
 """Tests for functions."""
 
+import tempfile
 import unittest
+from pathlib import Path
 
 # Test functions within arrakis.rmsyth_oncuts
 
@@ -29,5 +31,87 @@ class TestRmsynthOncuts(unittest.TestCase):
         pass
 
 
+class TestImager(unittest.TestCase):
+    """Test imager functions."""
+
+    suffixes = ["image", "model", "psf", "residual", "dirty"]
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.directory = Path(self._tmpdir.name)
+        names = []
+        for chan in ["0000", "0001", "MFS"]:
+            for suffix in self.suffixes:
+                # Single pol - no pol in the name
+                names.append(f"single-{chan}-{suffix}.fits")
+                # Multiple pols - except the psf, which has no pol
+                if suffix == "psf":
+                    names.append(f"multi-{chan}-{suffix}.fits")
+                    continue
+                for pol in ["Q", "U"]:
+                    names.append(f"multi-{chan}-{pol}-{suffix}.fits")
+        # Files that must be ignored
+        names += [
+            "single-0000-image-pb.fits",
+            "single-0000-image.fits.tmp",
+            "other-0000-image.fits",
+        ]
+        for name in names:
+            (self.directory / name).touch()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _check(self, prefix: str, pols: list):
+        from arrakis.imager import scan_wsclean_outputs
+
+        outputs = scan_wsclean_outputs(
+            directory=self.directory, prefix_name=prefix, suffixes=self.suffixes
+        )
+        for pol in pols:
+            file_pol = None if len(pols) == 1 else pol
+            for suffix in self.suffixes:
+                # Channel images, as previously globbed
+                chan_glob = (
+                    f"{prefix}-*[0-9]-{suffix}.fits"
+                    if len(pols) == 1 or suffix == "psf"
+                    else f"{prefix}-*[0-9]-{pol}-{suffix}.fits"
+                )
+                chan_pol = None if suffix == "psf" else file_pol
+                self.assertEqual(
+                    outputs.get((chan_pol, suffix, False), []),
+                    sorted(self.directory.glob(chan_glob)),
+                )
+                # MFS images, as previously globbed
+                mfs_glob = (
+                    f"{prefix}-MFS-{pol}-{suffix}.fits"
+                    if len(pols) > 1
+                    else f"{prefix}-MFS-{suffix}.fits"
+                )
+                self.assertEqual(
+                    outputs.get((file_pol, suffix, True), []),
+                    sorted(self.directory.glob(mfs_glob)),
+                )
+
+    def test_scan_wsclean_outputs_single_pol(self):
+        """Test scan_wsclean_outputs with a single pol."""
+        self._check("single", ["I"])
+
+    def test_scan_wsclean_outputs_multi_pol(self):
+        """Test scan_wsclean_outputs with multiple pols."""
+        self._check("multi", ["Q", "U"])
+
+    def test_scan_wsclean_outputs_psf(self):
+        """Test scan_wsclean_outputs finds the pol-less psf."""
+        from arrakis.imager import scan_wsclean_outputs
+
+        outputs = scan_wsclean_outputs(
+            directory=self.directory, prefix_name="multi", suffixes=self.suffixes
+        )
+        self.assertEqual(len(outputs[(None, "psf", False)]), 2)
+        self.assertEqual(len(outputs[(None, "psf", True)]), 1)
+        self.assertNotIn(("Q", "psf", False), outputs)
+
+
 if __name__ == "__main__":
     unittest.main()